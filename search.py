@@ -20,6 +20,12 @@ try:
 
     # Additional time operations
     import time
+
+    # Reads the log file in the background while lines are being checked
+    import threading
+
+    # Passes blocks of the log file from the reading thread to the main program
+    import Queue
 except:
     print("Failed to load one or more required modules; are you using Python 2.7.3?")
     raise SystemExit
@@ -62,6 +68,12 @@ options = {
                         # The number of processes used
     "display":          "simple",
                         # How the information appears (as output)
+    "bucket":           "hour",
+                        # Width of each period shown by display "timeline" (minute, hour or day)
+    "blocksize":        1024,
+                        # Size of each block read from the log file, in kilobytes
+    "readahead":        4,
+                        # Number of blocks read ahead of the block being checked
     "location":         ""
                         # The location to search for information
 }
@@ -91,6 +103,22 @@ show_titles = 0
 mod_locations = 0
 # Provide "debounce" for printing values
 db = []
+# Report the speed at which log files were read if specified
+throughput = 0
+# Keep the number of bytes read and the time spent reading them (seek and read only) for "throughput"
+bytes_read = 0
+read_seconds = 0
+# Keep the number of bytes searched (not those read ahead but never used) and the time taken to read and search them for "throughput"
+bytes_scanned = 0
+scan_seconds = 0
+# Number of seconds in each bucket available to display "timeline"
+bucket_seconds = {"minute": 60, "hour": 3600, "day": 86400}
+# Difference arrays for display "timeline" (bucket index: change in busy nodes/cores from the previous bucket)
+timeline_nodes = {}
+timeline_cores = {}
+# Node-seconds and core-seconds of jobs that only cover part of a bucket (bucket index: seconds)
+partial_nodes = {}
+partial_cores = {}
 
 
 
@@ -100,24 +128,64 @@ db = []
 # Main body #
 # --------- #
 
-# Read the log file (magic)
-def line(name, size = 8192):
-    # Open the log file to read information
-    with open(name) as all_lines:
-        # Set the offset for file reading (don't read everything again)
-        offset = 0
+# Read blocks from the end of the log file to the beginning (runs in a separate thread)
+def read_blocks(name, size, blocks, stop):
+    global bytes_read
+    global read_seconds
+    try:
+        # Open the log file to read information
+        with open(name) as all_lines:
+            # Set the offset for file reading (don't read everything again)
+            offset = 0
+            all_lines.seek(0, os.SEEK_END)
+            file_size = remaining_size = all_lines.tell()
+            # Repeat until the beginning of the file is reached
+            while remaining_size > 0:
+                # Determine whether the next "group" of information should be the rest of the file
+                offset = min(file_size, offset + size)
+                # Time only the file operations (not the searching done by the main program)
+                started = time.time()
+                # Navigate the file
+                all_lines.seek(file_size - offset)
+                # Get the current "block" of lines
+                text = all_lines.read(min(remaining_size, size))
+                read_seconds += time.time() - started
+                bytes_read += len(text)
+                remaining_size -= size
+                # Stop reading if the main program has stopped (it empties the queue so that "put" can't wait forever)
+                if stop.is_set():
+                    return None
+                blocks.put(text)
+        # Show that the beginning of the file has been reached
+        if not stop.is_set():
+            blocks.put(None)
+    except Exception:
+        # Let the main program raise the error (with its original traceback) as if it had read the file itself
+        if not stop.is_set():
+            blocks.put(sys.exc_info())
+
+# Read the log file (magic); blocks are read ahead in the background so that a slow (network) file system is not waited on for every block
+def line(name, size = 1048576, depth = 4):
+    global bytes_scanned
+    global scan_seconds
+    # Hold at most "depth" blocks that have been read but not yet checked
+    blocks = Queue.Queue(depth)
+    stop = threading.Event()
+    reader = threading.Thread(target = read_blocks, args = (name, size, blocks, stop))
+    # Don't keep the program open if the reading thread is still running
+    reader.daemon = True
+    reader.start()
+    started = time.time()
+    try:
         part = None
-        all_lines.seek(0, os.SEEK_END)
-        file_size = remaining_size = all_lines.tell()
-        # Repeat until the beginning of the file is reached
-        while remaining_size > 0:
-            # Determine whether the next "group" of information should be the rest of the file
-            offset = min(file_size, offset + size)
-            # Navigate the file
-            all_lines.seek(file_size - offset)
-            # Get the current "block" of lines
-            text = all_lines.read(min(remaining_size, size))
-            remaining_size -= size
+        while True:
+            # The reading thread always finishes by adding None or an error (from sys.exc_info()), so this can't wait forever
+            text = blocks.get()
+            if text is None:
+                break
+            if isinstance(text, tuple):
+                raise text[0], text[1], text[2]
+            bytes_scanned += len(text)
             lines = text.split("\n")
             # Ensure full lines are given (not parts of them)
             if part is not None:
@@ -131,6 +199,18 @@ def line(name, size = 8192):
                     yield lines[index]
         if part is not None:
             yield part
+    finally:
+        # Stop the reading thread (also done when the program stops early after finding enough results)
+        stop.set()
+        # Empty the queue so that the reading thread isn't left waiting to add a block
+        try:
+            while True:
+                blocks.get_nowait()
+        except Queue.Empty:
+            pass
+        # Wait for the current block to finish so that "bytes_read" and "read_seconds" are complete
+        reader.join()
+        scan_seconds += time.time() - started
 
 # Get content after "=" in Slurm variables
 def simple_value(here):
@@ -283,6 +363,75 @@ def sort_res(from_list):
         db.append(item)
     # job user group job_name job_state partition time_limit start_time end_time node_list node_count process_count working_directory
 
+# Add a matching job to the timeline (only the buckets are kept, not the job itself)
+def add_to_timeline(job_line):
+    global partial_cores
+    global partial_nodes
+    global timeline_cores
+    global timeline_nodes
+    width = bucket_seconds[options["bucket"]]
+    # Count seconds from a fixed date so that buckets line up with the times in the log file
+    epoch = datetime.datetime(1970, 1, 1)
+    start = datetime.datetime.strptime(job_line.split(" ")[7].split("=")[1].replace("T", " "), "%Y-%m-%d %H:%M:%S")
+    end = datetime.datetime.strptime(job_line.split(" ")[8].split("=")[1].replace("T", " "), "%Y-%m-%d %H:%M:%S")
+    start = int((start - epoch).total_seconds())
+    end = int((end - epoch).total_seconds())
+    n_node = int(job_line.split(" ")[10].split("=")[1])
+    n_process = int(job_line.split(" ")[11].split("=")[1])
+    # Jobs that never ran take no time on the cluster
+    if end <= start:
+        return None
+    first = start // width
+    last = end // width
+    if first == last:
+        # The job starts and finishes in the same bucket
+        partial_nodes[first] = partial_nodes.get(first, 0) + (end - start) * n_node
+        partial_cores[first] = partial_cores.get(first, 0) + (end - start) * n_process
+    else:
+        # Count the time spent in the first and last buckets separately
+        partial_nodes[first] = partial_nodes.get(first, 0) + ((first + 1) * width - start) * n_node
+        partial_cores[first] = partial_cores.get(first, 0) + ((first + 1) * width - start) * n_process
+        # Jobs finishing exactly at the start of a bucket take no time in it
+        if end > last * width:
+            partial_nodes[last] = partial_nodes.get(last, 0) + (end - last * width) * n_node
+            partial_cores[last] = partial_cores.get(last, 0) + (end - last * width) * n_process
+        # Every bucket in between is fully busy; mark only where that begins and ends
+        if last - first > 1:
+            timeline_nodes[first + 1] = timeline_nodes.get(first + 1, 0) + n_node
+            timeline_cores[first + 1] = timeline_cores.get(first + 1, 0) + n_process
+            timeline_nodes[last] = timeline_nodes.get(last, 0) - n_node
+            timeline_cores[last] = timeline_cores.get(last, 0) - n_process
+
+# Display the number of busy nodes and cores in each bucket (averaged over the bucket)
+def print_timeline():
+    global partial_cores
+    global partial_nodes
+    global timeline_cores
+    global timeline_nodes
+    width = bucket_seconds[options["bucket"]]
+    label = {"minute": "%Y-%m-%d %H:%M", "hour": "%Y-%m-%d %H:00", "day": "%Y-%m-%d"}[options["bucket"]]
+    epoch = datetime.datetime(1970, 1, 1)
+    print("Bucket|Busy Nodes|Busy Cores")
+    # Every job that ran starts part-way through (or at the start of) a bucket, so the first bucket is always partial
+    if len(partial_nodes) > 0:
+        # Full buckets end just before the bucket where their count is removed
+        first = min(partial_nodes.keys())
+        last = max(list(partial_nodes.keys()) + [index - 1 for index in timeline_nodes.keys()])
+        # Sweep across every bucket from the first to the last, keeping a running total of fully busy nodes/cores
+        busy_nodes = 0
+        busy_cores = 0
+        for index in range(first, last + 1):
+            busy_nodes += timeline_nodes.get(index, 0)
+            busy_cores += timeline_cores.get(index, 0)
+            nodes = busy_nodes + float(partial_nodes.get(index, 0)) / width
+            cores = busy_cores + float(partial_cores.get(index, 0)) / width
+            print((epoch + datetime.timedelta(seconds = index * width)).strftime(label) + "|" + "{0:.2f}".format(nodes) + "|" + "{0:.2f}".format(cores))
+    # Reset the timeline in case other blocks need to be executed
+    timeline_nodes = {}
+    timeline_cores = {}
+    partial_nodes = {}
+    partial_cores = {}
+
 # Format a list of nodes (as a string, not a list)
 def format_nodes(node_list):
     # Add a place to store formatted nodes
@@ -376,7 +525,7 @@ def run():
     global results
     global requested
     # Things to do for each line
-    for part in line(options["location"]):
+    for part in line(options["location"], int(options["blocksize"]) * 1024, int(options["readahead"])):
         try:
             # Reset "correct" for all lines
             correct = []
@@ -424,8 +573,12 @@ def run():
                 t_limit = part.split(" ")[6].split("=")[1]
                 perc = float(r_time) / float(t_limit) * 100
                 format_text_fields(str(perc), options["timepercentage"], "timepercentage")
+            # Add every matching line to the timeline instead of "results" (all jobs are counted, regardless of "show")
+            if options["display"] == "timeline":
+                if requested == len(correct):
+                    add_to_timeline(part)
             # Add line to "results" if all requested variables are found
-            if requested == len(correct) and (options["show"] == "all" or len(results) < int(options["show"])):
+            elif requested == len(correct) and (options["show"] == "all" or len(results) < int(options["show"])):
                 if not part in results:
                     results.append(part)
             # If the user hasn't requested all results and enough have been found, print them
@@ -441,6 +594,12 @@ def run():
         except:
             pass
 
+    # Show the timeline once every location has been read
+    if options["display"] == "timeline":
+        if mod_locations == 0:
+            print_timeline()
+        return None
+
     # After the file has been read, print everything if a specific number of results was not requested
     if options["show"] == "all":
         if mod_locations == 0:
@@ -489,6 +648,11 @@ def separate_input(arguments):
     global number_of_errors
     global real_name
     global requested
+    global throughput
+    global bytes_read
+    global read_seconds
+    global bytes_scanned
+    global scan_seconds
 
     for item in range(0, len(arguments)):
         current = arguments[item]
@@ -528,6 +692,9 @@ def separate_input(arguments):
             # Allow real names to be searched
             elif current == "realname":
                 real_name = 1
+            # Allow the speed at which log files are read to be shown
+            elif current == "throughput":
+                throughput = 1
             # Set node list (don't format yet; done line-by-line)
             elif current.split("=")[0] == "node":
                 options["node"] = current.split("=")[1]
@@ -571,6 +738,26 @@ def separate_input(arguments):
             # Set the display
             elif current.split("=")[0] == "display":
                 options["display"] = current.split("=")[1]
+            # Set the size of each block read from the log file (must be a positive integer)
+            elif current.split("=")[0] == "blocksize":
+                if int(current.split("=")[1]) < 1:
+                    raise ValueError
+                options["blocksize"] = current.split("=")[1]
+            # Set the number of blocks to read ahead (must be a positive integer)
+            elif current.split("=")[0] == "readahead":
+                if int(current.split("=")[1]) < 1:
+                    raise ValueError
+                options["readahead"] = current.split("=")[1]
+            # Set the bucket width used by display "timeline"
+            elif current.split("=")[0] == "bucket":
+                if current.split("=")[1] in bucket_seconds:
+                    options["bucket"] = current.split("=")[1]
+                else:
+                    number_of_errors += 1
+                    bucket_error = "Block " + str(block) + ": Did not recognize the bucket \"" + current.split("=")[1] + "\"; use minute, hour or day. Using \"" + options["bucket"] + "\" instead.\n"
+                    error_text += bucket_error
+                    # Errors are only listed at the end in display "simple", so show this one now (separately from other output)
+                    sys.stderr.write(bucket_error)
             # If the variable cannot be found in the "options" dictionary
             else:
                 number_of_errors += 1
@@ -613,7 +800,17 @@ def separate_input(arguments):
             mod_locations = 1
         else:
             mod_locations = 0
+        bytes_read = 0
+        read_seconds = 0
+        bytes_scanned = 0
+        scan_seconds = 0
         run()
+        # Report the reading speed separately from the results so that parsed output is not affected
+        if throughput == 1:
+            megabytes = bytes_read / 1048576.0
+            scanned = bytes_scanned / 1048576.0
+            # "Read" counts only time spent reading the file; "scanned" counts the blocks that were searched, including the time taken to search and print them
+            sys.stderr.write("Read " + "{0:.2f}".format(megabytes) + " MB from " + options["location"] + " in " + "{0:.2f}".format(read_seconds) + " seconds (" + "{0:.2f}".format(megabytes / max(read_seconds, 0.000001)) + " MB/s); scanned " + "{0:.2f}".format(scanned) + " MB in " + "{0:.2f}".format(scan_seconds) + " seconds (" + "{0:.2f}".format(scanned / max(scan_seconds, 0.000001)) + " MB/s)\n")
 
 # Convert user input to information in "options" dictionary
 def interpret_input():
@@ -687,8 +884,12 @@ try:
             print("nnode\n  The number of nodes that were used by the job.\n  Options:\n    integer (e.g. 0, 1, 50)\n    logical (e.g. \">20\", \"10 or 20\")\n")
             print("nprocess\n  The number of process that were used by the job.\n  Options:\n    integer (e.g. 10, 20, 50)\n    logical (e.g. \"40 or 500\", \"<=50\")\n")
             print("strict\n  Stand-alone; avoid showing the help menu with no other arguments.\n")
+            print("throughput\n  Stand-alone; show the speed at which each log file was read, and the overall speed including searching (shown separately from other output).\n")
+            print("blocksize\n  The size of each block read from the log file, in kilobytes; larger blocks are faster on network file systems.\n  Options:\n    integer (e.g. 256, 1024 (default), 4096)\n")
+            print("readahead\n  The number of blocks read in the background ahead of the block being searched.\n  Options:\n    integer (e.g. 1, 4 (default), 16)\n")
             print("realname\n  Stand-alone; try to find the real name of users (not shown in \"display=format\").\n")
-            print("display\n  The display options to be used by the program.\n  Options:\n    \"simple\" (default): Show information in a human-readable manner.\n    \"neat\": Format all information for parsing.\n    \"format\": Format the Slurm line for parsing.")
+            print("display\n  The display options to be used by the program.\n  Options:\n    \"simple\" (default): Show information in a human-readable manner.\n    \"neat\": Format all information for parsing.\n    \"format\": Format the Slurm line for parsing.\n    \"timeline\": Show the average number of busy nodes and cores in each period (see \"bucket\"); all matching jobs are counted.\n")
+            print("bucket\n  The length of each period shown by \"display=timeline\".\n  Options:\n    \"minute\"\n    \"hour\" (default)\n    \"day\"")
     else:
         # Execute the main body of the program if no help is required
         call_run()